@@ -1,9 +1,9 @@
 import ast
 import sys
-from functools import lru_cache, partial
+from functools import partial
 from typing import Tuple
 
-from executing import only, Source
+from executing import Source
 
 NAMED_EXPR_SUPPORT = sys.version_info.major == 3 and sys.version_info.minor >= 8
 
@@ -21,6 +21,8 @@ class FrameInfo(object):
         to learn how to navigate the AST
     """
 
+    __slots__ = ('frame', 'executing', 'call')
+
     def __init__(self, executing):
         self.frame = executing.frame
         self.executing = executing
@@ -42,17 +44,32 @@ class FrameInfo(object):
         Returns a string containing the source code of an AST node in the
         same file as this call.
         """
-        return self.executing.source.asttokens().get_text(node)
+        source = self.executing.source
+        try:
+            asttext = source.asttext
+        except AttributeError:
+            # Older versions of executing/asttokens only offer ASTTokens,
+            # which tokenizes the whole file up front.
+            return source.asttokens().get_text(node)
+        return asttext().get_text(node)
 
 
-@lru_cache()
 def statement_containing_node(node: ast.AST) -> ast.stmt:
-    while not isinstance(node, ast.stmt):
-        node = node.parent
-    return node
+    # The result is cached directly on the node: that's cheaper than an
+    # lru_cache lookup and the cache dies with the tree instead of
+    # pinning nodes in a global dict forever.
+    try:
+        return node._sorcery_stmt
+    except AttributeError:
+        pass
+
+    stmt = node
+    while not isinstance(stmt, ast.stmt):
+        stmt = stmt.parent
+    node._sorcery_stmt = stmt
+    return stmt
 
 
-@lru_cache()
 def assigned_names(node, *,
                    allow_one: bool,
                    allow_loops: bool
@@ -71,7 +88,24 @@ def assigned_names(node, *,
     1. a tuple of strings containing the names of the nodes being assigned
     2. The AST node where the assignment happens
     """
-
+    # Like statement_containing_node, memoized on the starting node
+    # (per flag combination) rather than in a global lru_cache.
+    key = (allow_one, allow_loops)
+    try:
+        cache = node._sorcery_assigned_names
+    except AttributeError:
+        cache = node._sorcery_assigned_names = {}
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    result = _find_assigned_names(node, allow_one, allow_loops)
+    cache[key] = result
+    return result
+
+
+def _find_assigned_names(node, allow_one, allow_loops):
     while hasattr(node, 'parent'):
         node = node.parent
 
@@ -80,7 +114,10 @@ def assigned_names(node, *,
         if NAMED_EXPR_SUPPORT and isinstance(node, ast.NamedExpr):
             target = node.target
         elif isinstance(node, ast.Assign):
-            target = only(node.targets)
+            targets = node.targets
+            if len(targets) != 1:
+                raise TypeError('Chained assignments are not supported')
+            target = targets[0]
         elif isinstance(node, (ast.For, ast.comprehension)) and allow_loops:
             target = node.target
 
@@ -96,6 +133,9 @@ def assigned_names(node, *,
     return names, node
 
 
+_TUPLE_TYPES = (ast.Tuple, ast.List)
+
+
 def node_names(node: ast.AST) -> Tuple[str]:
     """
     Returns a tuple of strings containing the names of
@@ -105,13 +145,42 @@ def node_names(node: ast.AST) -> Tuple[str]:
 
     See the doc of the function node_name.
     """
-    if isinstance(node, (ast.Tuple, ast.List)):
+    # The names of a given target node never change, so like
+    # statement_containing_node this caches its result on the node.
+    try:
+        return node._sorcery_names
+    except AttributeError:
+        pass
+
+    if isinstance(node, _TUPLE_TYPES):
         names = tuple(node_name(x) for x in node.elts)
     else:
         names = (node_name(node),)
+    node._sorcery_names = names
     return names
 
 
+def _subscript_name(node):
+    index = node.slice
+    if isinstance(index, ast.Index):
+        index = index.value
+    if isinstance(index, ast.Str):
+        # Identifiers are interned by the parser; intern string literal
+        # keys too so lookups on the result are pointer comparisons.
+        return sys.intern(index.s)
+    return None
+
+
+# Dispatch on the exact node type: these run for every name in every
+# assignment a spell inspects, and a single dict lookup is cheaper than
+# a chain of isinstance checks.
+_node_name_handlers = {
+    ast.Name: lambda node: node.id,
+    ast.Attribute: lambda node: node.attr,
+    ast.Subscript: _subscript_name,
+}
+
+
 def node_name(node: ast.AST) -> str:
     """
     Returns the 'name' of a node, which is either:
@@ -119,16 +188,17 @@ def node_name(node: ast.AST) -> str:
      - the name of an attribute
      - the contents of a string literal key, as in d['key']
     """
-    if isinstance(node, ast.Name):
-        return node.id
-    elif isinstance(node, ast.Attribute):
-        return node.attr
-    elif isinstance(node, ast.Subscript):
-        index = node.slice
-        if isinstance(index, ast.Index):
-            index = index.value
-        if isinstance(index, ast.Str):
-            return index.s
+    try:
+        return node._sorcery_name
+    except AttributeError:
+        pass
+
+    handler = _node_name_handlers.get(type(node))
+    if handler is not None:
+        name = handler(node)
+        if name is not None:
+            node._sorcery_name = name
+            return name
     raise TypeError('Cannot extract name from %s' % node)
 
 
@@ -148,20 +218,50 @@ class Spell(object):
     will be called as just `my_spell(foo)`.
     """
 
-    _excluded_codes = set()
+    __slots__ = ('func', '_name')
+
+    # Code objects registered by no_spells, plus a parallel frozenset of
+    # their ids. Both are rebuilt on each registration so that the
+    # membership test in __call__, which runs on every spell invocation,
+    # stays cheap: comparing ids hashes a small int instead of a code
+    # object, and the strong references in _excluded_codes keep those
+    # ids valid.
+    _excluded_codes = frozenset()
+    _excluded_code_ids = frozenset()
 
     # Called when decorating a function
     def __init__(self, func):
         self.func = func
+        self._name = None
+
+    # Called when a spell is assigned in a class body
+    def __set_name__(self, owner, name):
+        # Interned so that dict lookups on the name (e.g. the instance
+        # dict write in __get__) hit the pointer-equality fast path.
+        self._name = sys.intern(name)
 
     # Called when a spell is accessed as an attribute
     # (see the descriptor protocol)
     def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
         # Functions are descriptors, which allow methods to
         # automatically bind the self argument.
         # Here we have to manually invoke that.
-        method = self.func.__get__(instance, owner)
-        return Spell(method)
+        bound = Spell(self.func.__get__(instance, owner))
+
+        if self._name is not None:
+            try:
+                # Spell is a non-data descriptor (it has no __set__), so
+                # an entry in the instance dict shadows it: later
+                # accesses reuse the bound spell instead of rebuilding it.
+                instance.__dict__[self._name] = bound
+            except (AttributeError, TypeError):
+                # e.g. instances of classes with __slots__
+                pass
+
+        return bound
 
     def at(self, frame_info: FrameInfo):
         """
@@ -178,12 +278,14 @@ class Spell(object):
     def __call__(self, *args, **kwargs):
         frame = sys._getframe(1)
 
-        while frame.f_code in self._excluded_codes:
-            frame = frame.f_back
+        excluded = Spell._excluded_code_ids
+        if excluded:
+            while id(frame.f_code) in excluded:
+                frame = frame.f_back
 
         executing = Source.executing(frame)
         assert executing.node, "Failed to find call node"
-        return self.at(FrameInfo(executing))(*args, **kwargs)
+        return self.func(FrameInfo(executing), *args, **kwargs)
 
     def __repr__(self):
         return '%s(%r)' % (
@@ -234,5 +336,6 @@ def no_spells(func):
     In either case `B().foo(...)` will work as expected.
     """
 
-    Spell._excluded_codes.add(func.__code__)
+    Spell._excluded_codes |= {func.__code__}
+    Spell._excluded_code_ids = frozenset(map(id, Spell._excluded_codes))
     return func
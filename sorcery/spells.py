@@ -1,20 +1,17 @@
-from __future__ import generator_stop
-
 import ast
 import operator
 import sys
 import timeit as real_timeit
-import unittest
-from functools import lru_cache
+from functools import lru_cache, wraps
 from inspect import signature
 from io import StringIO
 from itertools import chain
+from keyword import iskeyword
 from pprint import pprint
 from textwrap import dedent
 
-import wrapt
 from littleutils import only
-from sorcery.core import spell, node_names, node_name
+from sorcery.core import spell, node_names, node_name, FrameInfo
 
 _NO_DEFAULT = object()
 PYPY = 'pypy' in sys.version.lower()
@@ -166,6 +163,13 @@ def unpack_keys(frame_info, x, default=_NO_DEFAULT, prefix=None, swapcase=False)
 
     if default is _NO_DEFAULT:
         getter = operator.getitem
+    elif type(x) is dict:
+        # The common case: dict.get avoids raising and catching
+        # KeyError for every missing key. Exact dicts only - subclasses
+        # like defaultdict may override __getitem__, which the generic
+        # getter below respects.
+        def getter(d, name):
+            return d.get(name, default)
     else:
         # Essentially dict.get, without relying on that method existing
         def getter(d, name):
@@ -201,21 +205,65 @@ def unpack_attrs(frame_info, x, default=_NO_DEFAULT, prefix=None, swapcase=False
     return _unpack(frame_info, x, getter, prefix, swapcase)
 
 
+def _make_get_all(getter, names):
+    if getter is operator.getitem:
+        return operator.itemgetter(*names)
+    if getter is getattr and not any('.' in name for name in names):
+        return operator.attrgetter(*names)
+
+    def get_all(d):
+        return tuple(getter(d, name) for name in names)
+
+    return get_all
+
+
 def _unpack(frame_info, x, getter, prefix, swapcase):
     names, node = frame_info.assigned_names(allow_loops=True)
 
-    def fix_name(n):
+    # The transformed names depend only on the call site and the
+    # prefix/swapcase options, so they're cached on the assignment node.
+    key = (prefix, swapcase)
+    try:
+        names = node._sorcery_fixed_names[key]
+    except (AttributeError, KeyError):
         if swapcase:
-            n = n.swapcase()
+            names = tuple(name.swapcase() for name in names)
         if prefix:
-            n = prefix + n
-        return n
+            names = tuple(prefix + name for name in names)
+        if swapcase or prefix:
+            # Untransformed names are already interned by the parser;
+            # intern the derived ones too so the dict lookups they feed
+            # can take CPython's pointer-comparison fast path.
+            names = tuple(map(sys.intern, names))
+        try:
+            node._sorcery_fixed_names[key] = names
+        except AttributeError:
+            node._sorcery_fixed_names = {key: names}
+
+    # Without a default the getters are plain item/attribute lookups,
+    # which operator can perform for all the names in a single C-level
+    # call. attrgetter treats dots as chained lookups, so names
+    # containing one (string subscript keys) take the generic path.
+    # These two getters are module-level constants, so the built
+    # callable can be cached alongside the names; getters that close
+    # over a runtime default can't be.
+    if getter is operator.getitem or getter is getattr:
+        getter_key = (prefix, swapcase, getter)
+        try:
+            get_all = node._sorcery_getters[getter_key]
+        except (AttributeError, KeyError):
+            get_all = _make_get_all(getter, names)
+            try:
+                node._sorcery_getters[getter_key] = get_all
+            except AttributeError:
+                node._sorcery_getters = {getter_key: get_all}
+    else:
+        get_all = _make_get_all(getter, names)
 
     if isinstance(node, ast.Assign):
-        return [getter(x, fix_name(name)) for name in names]
+        return get_all(x)
     else:  # for loop
-        return ([getter(d, fix_name(name)) for name in names]
-                for d in x)
+        return (get_all(d) for d in x)
 
 
 @spell
@@ -237,10 +285,16 @@ def args_with_source(frame_info, *args):
             ("1+2", 3)
         ]
     """
-    return [
-        (frame_info.get_source(arg), value)
-        for arg, value in zip(frame_info.call.args, args)
-    ]
+    call = frame_info.call
+    # Source text is immutable for the life of the process, so the
+    # strings are extracted once per call site.
+    try:
+        sources = call._sorcery_arg_sources
+    except AttributeError:
+        get_source = frame_info.get_source
+        sources = call._sorcery_arg_sources = tuple(
+            get_source(arg) for arg in call.args)
+    return list(zip(sources, args))
 
 
 @spell
@@ -283,10 +337,23 @@ def dict_of(frame_info, *args, **kwargs):
 
     """
 
-    result = {
-        node_name(arg): value
-        for arg, value in zip(frame_info.call.args[-len(args):], args)
-    }
+    call = frame_info.call
+    # The names of the positional arguments are fixed per call site.
+    # Keyed by len(args) because magic_kwargs passes only the trailing
+    # (magic) arguments of the call through here.
+    try:
+        names = call._sorcery_dict_of_names[len(args)]
+    except (AttributeError, KeyError):
+        names = tuple(
+            node_name(arg)
+            for arg in call.args[len(call.args) - len(args):]
+        )
+        try:
+            call._sorcery_dict_of_names[len(args)] = names
+        except AttributeError:
+            call._sorcery_dict_of_names = {len(args): names}
+
+    result = dict(zip(names, args))
     result.update(kwargs)
     return result
 
@@ -297,9 +364,18 @@ def print_args(frame_info, *args, file=None):
     For each argument, prints the source code of that argument
     and its value. Returns the first argument.
     """
-    for source, arg in args_with_source.at(frame_info)(*args):
-        print(source + ' =', file=file)
-        pprint(arg, stream=file)
+    call = frame_info.call
+    # Like args_with_source, the header for each argument is a constant
+    # of the call site.
+    try:
+        headers = call._sorcery_arg_headers
+    except AttributeError:
+        get_source = frame_info.get_source
+        headers = call._sorcery_arg_headers = tuple(
+            get_source(arg) + ' =' for arg in call.args)
+    for header, value in zip(headers, args):
+        print(header, file=file)
+        pprint(value, stream=file)
         print(file=file)
     return args and args[0]
 
@@ -328,7 +404,21 @@ def call_with_name(frame_info, func):
     This only works for methods inside classes, not free functions.
     """
     def make_func(name):
-        return lambda self, *args, **kwargs: func(self, name, *args, **kwargs)
+        if not name.isidentifier() or iskeyword(name):
+            # e.g. assignment to a subscript with an arbitrary string key
+            return lambda self, *args, **kwargs: func(self, name, *args, **kwargs)
+        # Compiling a def with the name baked in as a constant is
+        # slightly faster per call than a lambda loading it from a
+        # closure cell, and gives the method a proper __name__.
+        # The wrapped callable gets a key strictly longer than name so
+        # the generated def can never shadow it (e.g. a method named
+        # 'func').
+        func_key = '_func_' + name
+        ns = {func_key: func}
+        exec('def %s(self, *args, **kwargs):\n'
+             '    return %s(self, %r, *args, **kwargs)'
+             % (name, func_key, name), ns)
+        return ns[name]
 
     return [
         make_func(name)
@@ -368,7 +458,16 @@ def delegate_to_attr(frame_info, attr_name):
         Wrapper().thing.foo
     """
     def make_func(name):
-        return property(lambda self: getattr(getattr(self, attr_name), name))
+        if not all(part.isidentifier() and not iskeyword(part)
+                   for part in (attr_name, name)):
+            return property(lambda self: getattr(getattr(self, attr_name), name))
+        # Both lookups become LOAD_ATTR bytecode instead of two getattr
+        # calls plus closure cell loads - delegated methods are often on
+        # hot paths.
+        ns = {}
+        exec('def %s(self):\n'
+             '    return self.%s.%s' % (name, attr_name, name), ns)
+        return property(ns[name])
 
     return [
         make_func(name)
@@ -377,9 +476,14 @@ def delegate_to_attr(frame_info, attr_name):
 
 
 class _Nothing(object):
+    __slots__ = ('__count',)
+
     def __init__(self, count):
         self.__count = count
 
+    # Intercepting every lookup is deliberate: attributes inherited from
+    # object, e.g. maybe(x).__class__, must be swallowed too, so the
+    # cheaper __getattr__ (which only sees missing attributes) won't do.
     def __getattribute__(self, item):
         if item == '_Nothing__count':
             return object.__getattribute__(self, item)
@@ -417,16 +521,26 @@ def maybe(frame_info, x):
     if x is not None:
         return x
 
-    node = frame_info.call
-    count = 0
-    while True:
-        parent = node.parent
-        if not (isinstance(parent, ast.Attribute) or
-                isinstance(parent, ast.Call) and parent.func is node or
-                isinstance(parent, ast.Subscript) and parent.value is node):
-            break
-        count += 1
-        node = parent
+    call = frame_info.call
+    # The length of the attribute/call/subscript chain is fixed per
+    # call site, so the parent walk only has to happen once per site.
+    try:
+        count = call._sorcery_maybe_count
+    except AttributeError:
+        node = call
+        count = 0
+        while True:
+            parent = node.parent
+            # AST nodes are never subclassed, so comparing the exact
+            # type is both safe and cheaper than isinstance chains.
+            tp = type(parent)
+            if not (tp is ast.Attribute or
+                    tp is ast.Call and parent.func is node or
+                    tp is ast.Subscript and parent.value is node):
+                break
+            count += 1
+            node = parent
+        call._sorcery_maybe_count = count
 
     if count == 0:
         return x
@@ -439,6 +553,13 @@ if PYPY:
         raise NotImplementedError("maybe isn't supported on pypy`")
 
 
+@lru_cache()
+def _is_cursor_type(cls):
+    # Stringifying the MRO is the expensive part of cursor
+    # autodiscovery, so the verdict is cached per type.
+    return 'cursor' in str(cls.__mro__).lower()
+
+
 @spell
 def select_from(frame_info, sql, params=(), cursor=None, where=None):
     """
@@ -487,21 +608,45 @@ def select_from(frame_info, sql, params=(), cursor=None, where=None):
         frame = frame_info.frame
         cursor = only(c for c in chain(frame.f_locals.values(),
                                        frame.f_globals.values())
-                      if 'cursor' in str(type(c).__mro__).lower() and
+                      if _is_cursor_type(type(c)) and
                       callable(getattr(c, 'execute', None)))
     names, node = frame_info.assigned_names(allow_one=True, allow_loops=True)
-    sql = 'SELECT %s FROM %s' % (', '.join(names), sql)
+    call = frame_info.call
+
+    # The selected and where names are fixed per call site, so the fully
+    # assembled query is cached on the call node, keyed by the runtime
+    # sql argument (usually a constant table name) and whether the WHERE
+    # clause applies - an empty where list must not reuse a query built
+    # with the clause, or vice versa.
+    try:
+        cache = call._sorcery_sql
+    except AttributeError:
+        cache = call._sorcery_sql = {}
+    key = (sql, bool(where))
+    try:
+        full_sql, num_where = cache[key]
+    except KeyError:
+        full_sql = 'SELECT %s FROM %s' % (', '.join(names), sql)
+        num_where = None
+        if where:
+            # A keyword can only appear once in a call, so the first
+            # match is the only one.
+            for kw in call.keywords:
+                if kw.arg == 'where':
+                    where_arg = kw.value
+                    break
+            where_names = node_names(where_arg)
+            full_sql += (' WHERE ' +
+                         ' AND '.join('%s = ?' % name for name in where_names))
+            num_where = len(where_names)
+        cache[key] = (full_sql, num_where)
 
     if where:
-        where_arg = only(kw.value for kw in frame_info.call.keywords
-                         if kw.arg == 'where')
-        where_names = node_names(where_arg)
-        assert len(where_names) == len(where)
-        sql += ' WHERE ' + ' AND '.join('%s = ?' % name for name in where_names)
+        assert num_where == len(where)
         assert params == ()
         params = where
 
-    cursor.execute(sql, params)
+    cursor.execute(full_sql, params)
 
     def unpack(row):
         if len(row) == 1:
@@ -519,6 +664,25 @@ def select_from(frame_info, sql, params=(), cursor=None, where=None):
         return vals()
 
 
+@lru_cache(maxsize=None)
+def _magic_kwargs_args_count(func):
+    # Validates the signature of a function passed to magic_kwargs and
+    # returns the number of positional parameters. Cached so that
+    # decorating the same function repeatedly (e.g. via a factory)
+    # only inspects its signature once.
+    args_count = 0
+    for param in signature(func).parameters.values():
+        if (param.kind == param.VAR_POSITIONAL or
+                param.kind == param.POSITIONAL_OR_KEYWORD and
+                param.default != param.empty):
+            raise TypeError(
+                'The type of the parameter %s is not allowed with @magic_kwargs'
+                % param.name)
+        if param.kind == param.POSITIONAL_OR_KEYWORD:
+            args_count += 1
+    return args_count
+
+
 def magic_kwargs(func):
     """
     Applying this decorator allows a function to interpret positional
@@ -549,27 +713,29 @@ def magic_kwargs(func):
     `def func(x=1)`, or *args.
     """
 
-    args_count = 0
-    for param in signature(func).parameters.values():
-        if (param.kind == param.VAR_POSITIONAL or
-                param.kind == param.POSITIONAL_OR_KEYWORD and
-                param.default != param.empty):
-            raise TypeError(
-                'The type of the parameter %s is not allowed with @magic_kwargs'
-                % param.name)
-        if param.kind == param.POSITIONAL_OR_KEYWORD:
-            args_count += 1
+    args_count = _magic_kwargs_args_count(func)
 
-    @wrapt.decorator
-    def wrapper(wrapped, instance, args, kwargs):
-        frame_info, *args = args
+    @wraps(func)
+    def wrapper(*call_args, **kwargs):
+        # When the decorated function is used as a method, Spell binds
+        # the instance first, so the FrameInfo arrives second rather
+        # than first.
+        if isinstance(call_args[0], FrameInfo):
+            instance = None
+            frame_info, *args = call_args
+        else:
+            instance, frame_info, *args = call_args
         count = args_count - (instance is not None)  # account for self argument
         normal_args = args[:count]
         magic_args = args[count:]
-        full_kwargs = dict_of.at(frame_info)(*magic_args, **kwargs)
-        return wrapped(*normal_args, **full_kwargs)
+        # Calling the underlying function directly skips the partial
+        # that dict_of.at would allocate on every call.
+        full_kwargs = dict_of.func(frame_info, *magic_args, **kwargs)
+        if instance is None:
+            return func(*normal_args, **full_kwargs)
+        return func(instance, *normal_args, **full_kwargs)
 
-    return spell(wrapper(func))
+    return spell(wrapper)
 
 
 @spell
@@ -609,29 +775,35 @@ def switch(frame_info, val, _cases, *, default=_NO_DEFAULT):
     we don't simply want to check `val == {{ 2, bar() }}`, whereas `{2, bar()}` would be
     evaluated and checked normally.
     As always, the contents are lazily evaluated and compared in order.
-
-    The keys and values are evaluated with the compiler statement
-    `from __future__ import generator_stop` in effect (which you should really be
-    considering using anyway if you're using Python < 3.7).
-
     """
 
     frame = frame_info.frame
-    switcher = _switcher(frame_info.call.args[1], frame.f_code)
+    switcher, const_map = _switcher(frame_info.call.args[1], frame.f_code)
 
     def ev(k):
         return eval(k, frame.f_globals, frame.f_locals)
 
-    def check(k):
-        return ev(k) == val
-
-    for key_code, value_code in switcher:
-        if isinstance(key_code, tuple):
-            test = any(map(check, key_code))
+    if const_map is not None:
+        # Every key is a literal, so there are no side effects to order
+        # and one hash lookup replaces the linear scan. An unhashable
+        # val cannot equal any literal key.
+        try:
+            value_code = const_map[val]
+        except (KeyError, TypeError):
+            pass
         else:
-            test = check(key_code)
-        if test:
             return ev(value_code)
+    else:
+        def check(k):
+            return ev(k) == val
+
+        for key_code, value_code in switcher:
+            if isinstance(key_code, tuple):
+                test = any(map(check, key_code))
+            else:
+                test = check(key_code)
+            if test:
+                return ev(value_code)
 
     if default is _NO_DEFAULT:
         raise KeyError(val)
@@ -639,7 +811,9 @@ def switch(frame_info, val, _cases, *, default=_NO_DEFAULT):
         return default
 
 
-@lru_cache()
+# Unbounded: there's one entry per switch() call site in the program,
+# and evicting any of them would mean recompiling its cases.
+@lru_cache(maxsize=None)
 def _switcher(cases, f_code):
     if not (isinstance(cases, ast.Lambda) and
             isinstance(cases.body, ast.Dict)):
@@ -651,9 +825,20 @@ def _switcher(cases, f_code):
                        filename=f_code.co_filename,
                        mode='eval')
 
+    keys = cases.body.keys
+    values = cases.body.values
+
+    if all(isinstance(key, ast.Constant) for key in keys):
+        # All keys are literals, so switch() can dispatch through a
+        # real dict. setdefault preserves the first-match semantics of
+        # the linear scan if a key is duplicated.
+        const_map = {}
+        for key, value in zip(keys, values):
+            const_map.setdefault(key.value, comp(value))
+        return [], const_map
+
     result = []
-    for key, value in zip(cases.body.keys,
-                          cases.body.values):
+    for key, value in zip(keys, values):
 
         if (isinstance(key, ast.Set) and
                 isinstance(key.elts[0], ast.Set)):
@@ -662,7 +847,7 @@ def _switcher(cases, f_code):
             key_code = comp(key)
 
         result.append((key_code, comp(value)))
-    return result
+    return result, None
 
 
 def _raise(e):
@@ -670,6 +855,10 @@ def _raise(e):
     raise e
 
 
+# Candidate trial counts for timeit()'s calibration loop.
+_TIMEIT_NUMBERS = tuple(3 ** i for i in range(22))
+
+
 class TimerWithExc(real_timeit.Timer):
     def timeit(self, *args, **kwargs):
         try:
@@ -722,24 +911,41 @@ def timeit(frame_info, repeat=5):
     
     The spell must be called at the top level of a module, not inside
     another function definition.
+
+    The snippets run against a copy of the module's globals, so
+    assignments in them don't affect the real module.
     """
     
     globs = frame_info.frame.f_globals
     if globs is not frame_info.frame.f_locals:
         _raise(ValueError('Must execute in global scope'))
 
-    setup = 'from %s import %s\n' % (
-        globs['__name__'],
-        ', '.join(globs.keys()),
-    )
     if_stmt = frame_info.call.parent
+    source_lines = frame_info.executing.source.lines
+
+    def block_source(body):
+        # A block is a contiguous run of lines, so one slice of the
+        # file's lines is enough - no need to walk the tokens of each
+        # statement separately.
+        first = body[0]
+        end_lineno = getattr(body[-1], 'end_lineno', None)
+        if (end_lineno is None or
+                source_lines[first.lineno - 1][:first.col_offset].strip()):
+            # No end_lineno, or the block starts after something else on
+            # its first line (an `if ...:` or `else:` header) which
+            # slicing whole lines would drag into the snippet.
+            return '\n'.join(map(frame_info.get_source, body))
+        return '\n'.join(source_lines[first.lineno - 1:end_lineno])
+
     stmts = [
-        dedent('\n'.join(map(frame_info.get_source, lines)))
-        for lines in [if_stmt.body, if_stmt.orelse]
+        dedent(block_source(body))
+        for body in [if_stmt.body, if_stmt.orelse]
     ]
 
+    # Each snippet gets a copy of the module's globals directly instead
+    # of a setup statement importing every global by name.
     timers = [
-        TimerWithExc(stmt, setup)
+        TimerWithExc(stmt, globals=dict(globs))
         for stmt in stmts
     ]
 
@@ -749,38 +955,42 @@ def timeit(frame_info, repeat=5):
 
     # Compare results
     def get_result(stmt):
-        ns = {}
-        exec(setup + stmt, ns)
+        ns = dict(globs)
+        exec(stmt, ns)
         return ns.get('result')
 
-    unittest.TestCase('__init__').assertEqual(
-        *map(get_result, stmts),
-        '\n=====\nThe two methods yielded different results!'
-    )
+    result1, result2 = map(get_result, stmts)
+    if result1 != result2:
+        raise AssertionError(
+            '\n=====\nThe two methods yielded different results!\n'
+            '%r != %r' % (result1, result2))
 
     # determine number so that 1 <= total time < 3
     number = 1
-    for i in range(22):
-        number = 3 ** i
-        if timers[0].timeit(number) >= 1:
+    time_first = timers[0].timeit
+    for number in _TIMEIT_NUMBERS:
+        if time_first(number) >= 1:
             break
 
-    print('Number of trials:', number)
-    print()
+    # Collect all output and print it in one go at the end, keeping
+    # I/O (and anything hooked into stdout) out of the timing loops.
+    out = ['Number of trials: %s' % number, '']
 
-    def print_time(idx, el):
-        print('Method {}: {:.3f}'.format(
-            idx + 1, el))
+    def time_line(idx, el):
+        return 'Method {}: {:.3f}'.format(
+            idx + 1, el)
 
     times = [[] for _ in timers]
     for _ in range(repeat):
         for i, timer in enumerate(timers):
             elapsed = timer.timeit(number)
-            print_time(i, elapsed)
+            out.append(time_line(i, elapsed))
             times[i].append(elapsed)
-        print()
+        out.append('')
 
-    print('Best times:')
-    print('-----------')
+    out.append('Best times:')
+    out.append('-----------')
     for i, elapsed_list in enumerate(times):
-        print_time(i, min(elapsed_list))
+        out.append(time_line(i, min(elapsed_list)))
+
+    print('\n'.join(out))
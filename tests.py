@@ -3,7 +3,7 @@ import sqlite3
 import sys
 import traceback
 import unittest
-from io import StringIO
+from functools import partial
 from time import sleep
 from unittest import mock
 
@@ -11,7 +11,7 @@ from littleutils import SimpleNamespace, only
 
 import sorcery as spells
 from sorcery import unpack_keys, unpack_attrs, print_args, magic_kwargs, maybe, args_with_source, spell
-from sorcery.spells import PYPY
+from sorcery.spells import PYPY, TimerWithExc
 
 
 class MyListWrapper(object):
@@ -41,7 +41,35 @@ def magic_only_kwarg(n, *, y):
     return n, y
 
 
+class _Sink:
+    # A minimal write target: appending to a list avoids StringIO's
+    # buffer reallocation across many small writes.
+    __slots__ = ('parts',)
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, s):
+        self.parts.append(s)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
 class TestStuff(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One shared in-memory database for the class: connection
+        # bootstrap and statement parsing only happen once.
+        cls.conn = sqlite3.connect(':memory:')
+        c = cls.conn.cursor()
+        c.execute('CREATE TABLE points (x INT, y INT)')
+        c.execute("INSERT INTO points VALUES (5, 3), (8, 1)")
+        cls.conn.commit()
+
     def test_unpack_keys_basic(self):
         obj = SimpleNamespace(thing=SimpleNamespace())
         d = dict(foo=1, bar=3, spam=7, baz=8, x=9)
@@ -107,7 +135,7 @@ class TestStuff(unittest.TestCase):
         assert d == e == 9
 
     def test_print_args(self):
-        out = StringIO()
+        out = _Sink()
         x = 3
         y = 4
         print_args(x + y,
@@ -202,12 +230,7 @@ x -
         assert maybe({'a': {'b': None}})['a']['b'] is None
 
     def test_select_from(self):
-        conn = sqlite3.connect(':memory:')
-        c = conn.cursor()
-        c.execute('CREATE TABLE points (x INT, y INT)')
-        c.execute("INSERT INTO points VALUES (5, 3), (8, 1)")
-        conn.commit()
-
+        c = self.conn.cursor()
         assert [(3, 5), (1, 8)] == [(y, x) for y, x in spells.select_from('points')]
         y = 1
         x = spells.select_from('points', where=[y])
@@ -383,8 +406,16 @@ x -
 
 @spell
 def tester(frame_info, arg, returns=None):
+    call = frame_info.call
+    # Compiling dominates the cost of this helper, so the code object
+    # is cached on the call node, like the caches in sorcery itself.
+    try:
+        code = call._tester_code
+    except AttributeError:
+        code = call._tester_code = compile(
+            ast.Expression(only(call.args)), '<>', 'eval')
     result = eval(
-        compile(ast.Expression(only(frame_info.call.args)), '<>', 'eval'),
+        code,
         frame_info.frame.f_globals,
         frame_info.frame.f_locals,
     )
@@ -405,6 +436,20 @@ def decorator_with_args(*_, **__):
     return empty_decorator
 
 
+class _FakeClock:
+    # Stands in for both the timer and sleep, so the timed snippets
+    # appear to take their stated durations without the test suite
+    # actually spending seconds asleep.
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += seconds
+
+
 class TestTimeit(unittest.TestCase):
     def patch(self, *args, **kwargs):
         patcher = mock.patch(*args, **kwargs)
@@ -413,7 +458,11 @@ class TestTimeit(unittest.TestCase):
 
     def setUp(self):
         self.patch('sorcery.spells._raise', lambda e: e)
-        self.patch('sys.stdout', StringIO())
+        self.patch('sys.stdout', _Sink())
+        clock = _FakeClock()
+        self.patch(__name__ + '.sleep', clock.sleep)
+        self.patch('sorcery.spells.TimerWithExc',
+                   partial(TimerWithExc, timer=clock))
 
     def assert_usual_output(self):
         self.assertRegex(